@@ -5,6 +5,15 @@ import io
 import json
 from datetime import datetime
 import time
+import os
+import copy
+import uuid
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import closing
+from functools import lru_cache
 
 # Custom CSS for advanced styling
 def inject_custom_css():
@@ -82,21 +91,126 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-def extract_text_from_pdf(uploaded_file):
-    """Extract text from PDF"""
+FINGERPRINT_SAMPLE = 64
+
+def pdf_object_digest(obj, memo, active):
+    """Content digest of a PDF object, following references into streams and dictionaries"""
+    if isinstance(obj, PyPDF2.generic.IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key in memo:
+            return memo[key]
+        if key in active:
+            return b"cycle"
+        active.add(key)
+        digest = pdf_object_digest(obj.get_object(), memo, active)
+        active.discard(key)
+        # Shared objects such as fonts are hashed once per document
+        memo[key] = digest
+        return digest
+    
+    h = hashlib.sha256(type(obj).__name__.encode())
+    if isinstance(obj, PyPDF2.generic.StreamObject):
+        # Encoded bytes, never decompressed; /Filter and /DecodeParms are hashed with the dictionary
+        h.update(getattr(obj, "_data", b"") or b"")
+    if isinstance(obj, dict):
+        for key in sorted(obj):
+            if key != "/Parent":
+                h.update(str(key).encode())
+                h.update(pdf_object_digest(obj[key], memo, active))
+    elif isinstance(obj, list):
+        for item in obj:
+            h.update(pdf_object_digest(item, memo, active))
+    elif not isinstance(obj, PyPDF2.generic.StreamObject):
+        h.update(repr(obj).encode())
+    return h.digest()
+
+def page_resources(page):
+    """Resources of a page, including ones inherited from its parent page tree nodes"""
+    node = page
+    while node is not None:
+        if "/Resources" in node:
+            return node.raw_get("/Resources")
+        node = node.get("/Parent")
+        node = node.get_object() if node is not None else None
+    return None
+
+def page_fingerprints(pdf_reader):
+    """Fingerprint each page from its raw content and resources, without decoding any stream
+
+    Resources are part of the fingerprint because text can be drawn through
+    form XObjects and decoded through font ToUnicode maps.
+    """
+    memo = {}
+    fingerprints = []
+    for page in pdf_reader.pages:
+        h = hashlib.sha256()
+        if "/Contents" in page:
+            h.update(pdf_object_digest(page.raw_get("/Contents"), memo, set()))
+        resources = page_resources(page)
+        if resources is not None:
+            h.update(pdf_object_digest(resources, memo, set()))
+        fingerprints.append(h.hexdigest())
+    return fingerprints
+
+def unique_page_texts(document):
+    """Fingerprint -> text for non-blank pages whose fingerprint maps to a single text"""
+    texts = {}
+    for fingerprint, page_text in zip(document['page_fingerprints'], document['page_texts']):
+        texts.setdefault(fingerprint, set()).add(page_text)
+    # Blank pages say nothing about which edition this is, so they are never matched
+    return {
+        fingerprint: next(iter(page_texts))
+        for fingerprint, page_texts in texts.items()
+        if len(page_texts) == 1 and next(iter(page_texts)).strip()
+    }
+
+def find_known_pages(fingerprints, store):
+    """Text of pages already stored with the closest earlier edition, by fingerprint"""
+    sample = [fingerprints[i] for i in stratified_order(len(fingerprints))[:FINGERPRINT_SAMPLE]]
+    base_hash = store.find_document_by_pages(sample)
+    base = store.get_document(base_hash) if base_hash else None
+    if not base or 'page_fingerprints' not in base:
+        return {}
+    return unique_page_texts(base)
+
+def join_pages(page_texts):
+    """Full document text, one line break after each non-empty page"""
+    return "".join(page_text + "\n" for page_text in page_texts if page_text)
+
+def build_document(page_texts, fingerprints, known_pages):
+    """Assemble a stored document from its page texts"""
+    # Chunk the whole text so chunks can span pages, exactly as for a first upload
+    text = join_pages(page_texts)
+    return {
+        'chunks': chunk_text(text) if text else [],
+        'page_count': len(page_texts),
+        'text_length': len(text),
+        'page_texts': page_texts,
+        'page_fingerprints': fingerprints,
+        'reused_pages': sum(1 for fingerprint in fingerprints if fingerprint in known_pages)
+    }
+
+def extract_document(uploaded_file, store):
+    """Extract a PDF page by page, reusing unchanged pages of a stored edition"""
     try:
         pdf_reader = PyPDF2.PdfReader(uploaded_file)
-        text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-        return text, len(pdf_reader.pages)
+        fingerprints = page_fingerprints(pdf_reader)
+        known_pages = find_known_pages(fingerprints, store)
+        page_texts = []
+        for page, fingerprint in zip(pdf_reader.pages, fingerprints):
+            if fingerprint in known_pages:
+                page_texts.append(known_pages[fingerprint])
+            else:
+                page_texts.append(page.extract_text() or "")
+        return build_document(page_texts, fingerprints, known_pages)
     except Exception as e:
         st.error(f"Error reading PDF: {e}")
-        return "", 0
+        return None
+
+DEFAULT_CHUNK_SIZE = 800
+DEFAULT_CHUNK_OVERLAP = 100
 
-def chunk_text(text, chunk_size=800, chunk_overlap=100):
+def chunk_text(text, chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP):
     """Split text into manageable chunks"""
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
@@ -105,14 +219,296 @@ def chunk_text(text, chunk_size=800, chunk_overlap=100):
     )
     return text_splitter.split_text(text)
 
-def create_detailed_summary(chunks):
+def chunk_pages(page_texts, chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP):
+    """Chunk stored page texts, without touching the PDF"""
+    text = join_pages(page_texts)
+    return chunk_text(text, chunk_size, chunk_overlap) if text else []
+
+@st.cache_resource(max_entries=32)
+def get_chunk_set(doc_hash, chunk_size, chunk_overlap, _page_texts):
+    """Cached chunk set of one document for one chunk setting"""
+    return chunk_pages(_page_texts, chunk_size, chunk_overlap)
+
+def document_chunks(doc_hash, document, chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP):
+    """Chunks of a stored document for the requested chunk setting"""
+    # Default chunks are stored with the document; older documents have no page texts to re-chunk
+    if (chunk_size, chunk_overlap) == (DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP) or 'page_texts' not in document:
+        return document['chunks']
+    return get_chunk_set(doc_hash, chunk_size, chunk_overlap, document['page_texts'])
+
+# Session state backends
+def indexed_fingerprints(document):
+    """Page fingerprints worth indexing to find earlier editions of a document"""
+    if 'page_fingerprints' not in document:
+        return []
+    return list(unique_page_texts(document))
+
+SESSION_TTL = int(os.environ.get("BOOK_ANALYZER_SESSION_TTL", 2 * 60 * 60))
+MAX_SESSIONS = 1000
+MAX_UNREFERENCED_DOCUMENTS = 4
+
+class InMemoryStateStore:
+    """Process-local state store (default, single replica)
+
+    Sessions idle for longer than session_ttl are evicted, oldest first, and
+    at most max_sessions are kept. Documents no live session refers to are
+    kept in a small LRU so re-uploads and new editions can still reuse them.
+    """
+    def __init__(self, session_ttl=SESSION_TTL, max_sessions=MAX_SESSIONS,
+                 max_unreferenced_documents=MAX_UNREFERENCED_DOCUMENTS):
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.max_unreferenced_documents = max_unreferenced_documents
+        self._lock = threading.Lock()
+        # Both ordered from least to most recently used
+        self._sessions = OrderedDict()
+        self._documents = OrderedDict()
+        self._pages = {}
+
+    def load(self, session_id, key, default=None):
+        with self._lock:
+            self._evict_sessions()
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return copy.deepcopy(default)
+            self._sessions[session_id] = (time.time(), entry[1])
+            self._sessions.move_to_end(session_id)
+            value = entry[1].get(key, default)
+        return copy.deepcopy(value)
+
+    def save(self, session_id, key, value):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            values = entry[1] if entry else {}
+            values[key] = copy.deepcopy(value)
+            self._sessions[session_id] = (time.time(), values)
+            if self._evict_sessions():
+                self._evict_documents()
+
+    def touch(self, session_id):
+        """Mark a session as active; returns False if it was already evicted"""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return False
+            self._sessions[session_id] = (time.time(), entry[1])
+            return True
+
+    def get_document(self, doc_hash):
+        # Documents are immutable and shared by every session that uploads them
+        with self._lock:
+            document = self._documents.get(doc_hash)
+            if document is not None:
+                self._documents.move_to_end(doc_hash)
+            return document
+
+    def put_document(self, doc_hash, document):
+        with self._lock:
+            self._documents[doc_hash] = document
+            self._documents.move_to_end(doc_hash)
+            for fingerprint in indexed_fingerprints(document):
+                self._pages.setdefault(fingerprint, set()).add(doc_hash)
+            self._evict_sessions()
+            self._evict_documents()
+
+    def _evict_sessions(self):
+        """Drop idle and excess sessions; returns whether any were dropped"""
+        now = time.time()
+        evicted = False
+        while self._sessions:
+            updated_at = next(iter(self._sessions.values()))[0]
+            if now - updated_at <= self.session_ttl and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            evicted = True
+        return evicted
+
+    def _evict_documents(self):
+        """Keep only referenced documents plus the most recent unreferenced ones"""
+        referenced = {
+            (values.get('analysis_data') or {}).get('doc_hash')
+            for _, values in self._sessions.values()
+        }
+        unreferenced = [doc_hash for doc_hash in self._documents if doc_hash not in referenced]
+        excess = len(unreferenced) - self.max_unreferenced_documents
+        for doc_hash in unreferenced[:max(0, excess)]:
+            document = self._documents.pop(doc_hash)
+            for fingerprint in indexed_fingerprints(document):
+                doc_hashes = self._pages.get(fingerprint)
+                if doc_hashes is not None:
+                    doc_hashes.discard(doc_hash)
+                    if not doc_hashes:
+                        del self._pages[fingerprint]
+
+    def find_document_by_pages(self, fingerprints):
+        """Stored document sharing the most pages with the given fingerprints"""
+        matches = {}
+        with self._lock:
+            for fingerprint in fingerprints:
+                for doc_hash in self._pages.get(fingerprint, ()):
+                    matches[doc_hash] = matches.get(doc_hash, 0) + 1
+        return max(matches, key=matches.get) if matches else None
+
+
+class SQLiteStateStore:
+    """Shared state store backed by a SQLite file, survives restarts
+
+    A single-host stand-in: WAL mode needs shared memory between processes,
+    so the file must live on a local disk, not a network filesystem.
+    """
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT, key TEXT, value TEXT, updated_at TEXT, "
+                "PRIMARY KEY (session_id, key))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "doc_hash TEXT PRIMARY KEY, payload TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS page_fingerprints ("
+                "fingerprint TEXT, doc_hash TEXT, "
+                "PRIMARY KEY (fingerprint, doc_hash))"
+            )
+        # Documents are content-addressed, so caching hits per process is always safe
+        self._read_cached = lru_cache(maxsize=8)(self._read_document)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self, session_id, key, default=None):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT value FROM sessions WHERE session_id = ? AND key = ?",
+                (session_id, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def save(self, session_id, key, value):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                (session_id, key, json.dumps(value, ensure_ascii=False), datetime.now().isoformat())
+            )
+
+    def touch(self, session_id):
+        """Sessions are never evicted from the SQLite store"""
+        return True
+
+    def get_document(self, doc_hash):
+        # Misses are not cached, another replica may store the document later
+        try:
+            return self._read_cached(doc_hash)
+        except KeyError:
+            return None
+
+    def _read_document(self, doc_hash):
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT payload FROM documents WHERE doc_hash = ?", (doc_hash,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(doc_hash)
+        return json.loads(row[0])
+
+    def put_document(self, doc_hash, document):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?)",
+                (doc_hash, json.dumps(document, ensure_ascii=False))
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO page_fingerprints VALUES (?, ?)",
+                [(fingerprint, doc_hash) for fingerprint in indexed_fingerprints(document)]
+            )
+        self._read_cached.cache_clear()
+
+    def find_document_by_pages(self, fingerprints):
+        """Stored document sharing the most pages with the given fingerprints"""
+        if not fingerprints:
+            return None
+        placeholders = ", ".join("?" * len(fingerprints))
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT doc_hash FROM page_fingerprints WHERE fingerprint IN (" + placeholders + ") "
+                "GROUP BY doc_hash ORDER BY COUNT(*) DESC LIMIT 1",
+                list(fingerprints)
+            ).fetchone()
+        return row[0] if row else None
+
+
+@st.cache_resource
+def get_state_store():
+    """Create the state store selected by BOOK_ANALYZER_STATE_BACKEND"""
+    backend = os.environ.get("BOOK_ANALYZER_STATE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteStateStore(os.environ.get("BOOK_ANALYZER_STATE_PATH", "book_analyzer_state.db"))
+    return InMemoryStateStore()
+
+def empty_analysis_data():
+    """Fresh per-session analysis state; chunks are referenced by doc_hash"""
+    return {
+        'summary': None,
+        'questions': None,
+        'faqs': None,
+        'doc_hash': None,
+        'page_count': 0,
+        'chunk_size': DEFAULT_CHUNK_SIZE,
+        'chunk_overlap': DEFAULT_CHUNK_OVERLAP,
+        'analysis_sources': {}
+    }
+
+def get_session_id():
+    """Stable session id kept in the URL so any replica can resume the session
+
+    The id is a bearer credential: anyone holding the URL can read and
+    write this session's analysis and chat history.
+    """
+    session_id = st.query_params.get("sid")
+    if not session_id:
+        session_id = uuid.uuid4().hex
+        st.query_params["sid"] = session_id
+    return session_id
+
+def load_session_state(store):
+    """Populate st.session_state from the state store once per browser session, then keep it alive"""
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = get_session_id()
+    session_id = st.session_state.session_id
+    if 'analysis_data' not in st.session_state:
+        st.session_state.analysis_data = store.load(session_id, 'analysis_data') or empty_analysis_data()
+    elif not store.touch(session_id):
+        # Evicted while the user was reading; this browser still holds the latest state
+        save_session_state(store)
+    if 'chat_history' not in st.session_state:
+        st.session_state.chat_history = store.load(session_id, 'chat_history', [])
+
+def save_session_state(store):
+    """Write analysis_data and chat_history back to the state store"""
+    session_id = st.session_state.session_id
+    store.save(session_id, 'analysis_data', st.session_state.analysis_data)
+    store.save(session_id, 'chat_history', st.session_state.chat_history)
+
+class NoProgress:
+    """Stand-in for st.progress when running outside a script run"""
+    def progress(self, value):
+        pass
+
+    def empty(self):
+        pass
+
+def create_detailed_summary(chunks, show_progress=True):
     """Create a comprehensive, detailed summary"""
     try:
         if not chunks:
             return "No text available for summary."
         
         # Progress bar for visual feedback
-        progress_bar = st.progress(0)
+        progress_bar = st.progress(0) if show_progress else NoProgress()
         
         # Extract key information from multiple chunks
         all_sentences = []
@@ -176,33 +572,39 @@ The document offers valuable insights for readers seeking comprehensive understa
     except Exception as e:
         return f"Error generating detailed summary: {str(e)}"
 
-def generate_comprehensive_questions(chunks):
+def extract_key_topics(chunks, progress_bar=None):
+    """Extract unique key topics from the leading chunks"""
+    key_topics = []
+    for i, chunk in enumerate(chunks[:6]):
+        sentences = [s.strip() for s in chunk.split('.') if len(s.strip()) > 30]
+        for sentence in sentences[:2]:
+            words = sentence.split()
+            if len(words) > 5:
+                topic = ' '.join(words[1:4])
+                if len(topic) > 8:
+                    key_topics.append(topic)
+        if progress_bar is not None:
+            progress_bar.progress((i + 1) / min(6, len(chunks)))
+    
+    # Remove duplicates but maintain order
+    seen = set()
+    unique_topics = []
+    for topic in key_topics:
+        if topic not in seen:
+            seen.add(topic)
+            unique_topics.append(topic)
+    return unique_topics
+
+def generate_comprehensive_questions(chunks, show_progress=True):
     """Generate comprehensive questions covering different aspects"""
     try:
         all_questions = []
         
         # Progress bar
-        progress_bar = st.progress(0)
+        progress_bar = st.progress(0) if show_progress else NoProgress()
         
         # Extract key topics from chunks
-        key_topics = []
-        for i, chunk in enumerate(chunks[:6]):
-            sentences = [s.strip() for s in chunk.split('.') if len(s.strip()) > 30]
-            for sentence in sentences[:2]:
-                words = sentence.split()
-                if len(words) > 5:
-                    topic = ' '.join(words[1:4])
-                    if len(topic) > 8:
-                        key_topics.append(topic)
-            progress_bar.progress((i + 1) / min(6, len(chunks)))
-        
-        # Remove duplicates but maintain order
-        seen = set()
-        unique_topics = []
-        for topic in key_topics:
-            if topic not in seen:
-                seen.add(topic)
-                unique_topics.append(topic)
+        unique_topics = extract_key_topics(chunks, progress_bar)
         
         # Generate comprehensive questions
         question_types = [
@@ -284,6 +686,310 @@ def generate_detailed_faqs(chunks):
     except Exception as e:
         return [("Q: Error generating FAQs", f"A: Technical issue: {str(e)}")]
 
+# Incremental re-analysis
+ANALYSIS_INPUTS = {
+    'summary': (create_detailed_summary, 8),
+    'questions': (generate_comprehensive_questions, 6),
+    'faqs': (generate_detailed_faqs, 4)
+}
+
+def ordered_chunks(chunks, order):
+    """Chunks in the order an analysis reads them: 'leading' or 'stratified'"""
+    return stratified_chunks_first(chunks) if order == 'stratified' else chunks
+
+def analysis_source(key, chunks, order):
+    """Digest of the chunks an analysis reads, plus the total section count"""
+    window = ANALYSIS_INPUTS[key][1]
+    payload = json.dumps([len(chunks), ordered_chunks(chunks, order)[:window]], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def run_analysis(analysis_data, key, chunks, order='leading'):
+    """Generate one analysis and record which chunks it was built from"""
+    generator = ANALYSIS_INPUTS[key][0]
+    analysis_data[key] = generator(ordered_chunks(chunks, order))
+    analysis_data.setdefault('analysis_sources', {})[key] = {
+        'order': order,
+        'digest': analysis_source(key, chunks, order)
+    }
+
+def plan_analysis(analysis_data, key, order):
+    """Have the next refresh build an analysis from chunks in the given order"""
+    sources = analysis_data.setdefault('analysis_sources', {})
+    if (sources.get(key) or {}).get('order') != order:
+        sources[key] = {'order': order, 'digest': None}
+
+def refresh_analysis(analysis_data, chunks):
+    """Recompute only the analyses whose source chunks changed, and any planned ones"""
+    sources = analysis_data.get('analysis_sources') or {}
+    for key in ANALYSIS_INPUTS:
+        source = sources.get(key)
+        if not analysis_data[key] and source is None:
+            continue
+        # Analyses saved without a source are regenerated once
+        source = source or {'order': 'leading', 'digest': None}
+        if analysis_source(key, chunks, source['order']) != source.get('digest'):
+            run_analysis(analysis_data, key, chunks, source['order'])
+
+# Progressive analysis
+PREVIEW_PAGES = 12
+PREVIEW_CHUNKS = 8
+PREVIEW_TIMEOUT = 1.0
+
+def stratified_order(count):
+    """Indices ordered coarse-to-fine so every prefix is spread across the whole range"""
+    order = []
+    seen = set()
+    step = max(1, count)
+    while True:
+        for i in range(0, count, step):
+            if i not in seen:
+                seen.add(i)
+                order.append(i)
+        if step == 1:
+            return order
+        step = max(1, step // 2)
+
+def stratified_chunks_first(chunks, sample_size=PREVIEW_CHUNKS):
+    """Move a sample spread across the book to the front, keeping reading order"""
+    sample = sorted(stratified_order(len(chunks))[:sample_size])
+    sampled = set(sample)
+    return [chunks[i] for i in sample] + [c for i, c in enumerate(chunks) if i not in sampled]
+
+class ProgressiveAnalysis:
+    """Background extraction that publishes refined previews as pages are processed"""
+    def __init__(self, doc_hash, pdf_bytes, store, chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP):
+        self.doc_hash = doc_hash
+        self.store = store
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.snapshot = None
+        self.error = None
+        self.done = False
+        self.preview_ready = threading.Event()
+        self._pdf_bytes = pdf_bytes
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            pdf_reader = PyPDF2.PdfReader(io.BytesIO(self._pdf_bytes))
+            page_count = len(pdf_reader.pages)
+            fingerprints = page_fingerprints(pdf_reader)
+            known_pages = find_known_pages(fingerprints, self.store)
+            page_texts = {}
+            checkpoint = PREVIEW_PAGES
+            # Pages are read in stratified order and the preview is refined at doubling checkpoints
+            for index in stratified_order(page_count):
+                if fingerprints[index] in known_pages:
+                    page_texts[index] = known_pages[fingerprints[index]]
+                else:
+                    page_texts[index] = pdf_reader.pages[index].extract_text() or ""
+                if len(page_texts) >= checkpoint and len(page_texts) < page_count:
+                    self._publish(page_texts, page_count)
+                    checkpoint = len(page_texts) * 2
+
+            document = build_document([page_texts[i] for i in range(page_count)], fingerprints, known_pages)
+            if not document['text_length']:
+                self.error = "No text could be extracted from this PDF"
+                return
+            self.store.put_document(self.doc_hash, document)
+        except Exception as e:
+            self.error = f"Error reading PDF: {e}"
+        finally:
+            self._pdf_bytes = None
+            self.done = True
+            self.preview_ready.set()
+
+    def _publish(self, page_texts, page_count):
+        processed = [page_texts[i] for i in sorted(page_texts)]
+        chunks = chunk_pages(processed, self.chunk_size, self.chunk_overlap)
+        ordered = stratified_chunks_first(chunks)
+        # Swap in a complete snapshot so readers never see a half-updated preview
+        self.snapshot = {
+            'chunks': chunks,
+            'pages_processed': len(page_texts),
+            'page_count': page_count,
+            'sections': len(chunks),
+            'text_length': len(join_pages(processed)),
+            'summary': create_detailed_summary(ordered, show_progress=False),
+            'topics': extract_key_topics(ordered),
+            'questions': generate_comprehensive_questions(ordered, show_progress=False)
+        }
+        self.preview_ready.set()
+
+
+@st.cache_resource
+def get_progressive_jobs():
+    """Process-wide registry of progressive analyses, shared by sessions of the same document"""
+    return threading.Lock(), {}
+
+def start_progressive_analysis(doc_hash, pdf_bytes, store, chunk_size=DEFAULT_CHUNK_SIZE, chunk_overlap=DEFAULT_CHUNK_OVERLAP):
+    """Return the running analysis for a document, starting one if needed"""
+    # Sessions joining a running analysis see previews chunked with the starting session's setting
+    lock, jobs = get_progressive_jobs()
+    with lock:
+        # Finished jobs have stored their document, and their sessions keep their own reference
+        for finished in [key for key, job in jobs.items() if job.done]:
+            del jobs[finished]
+        job = jobs.get(doc_hash)
+        if job is None:
+            job = jobs[doc_hash] = ProgressiveAnalysis(doc_hash, pdf_bytes, store, chunk_size, chunk_overlap)
+    return job
+
+def finish_progressive_analysis(job):
+    """Drop a finished analysis from the registry once a session has taken its results"""
+    lock, jobs = get_progressive_jobs()
+    with lock:
+        if jobs.get(job.doc_hash) is job:
+            del jobs[job.doc_hash]
+
+def render_analysis_cards(summary, questions, faqs):
+    """Summary, question and FAQ cards of the Analysis Dashboard"""
+    if summary:
+        st.markdown("<div class='analysis-card'>", unsafe_allow_html=True)
+        st.subheader("Executive Summary")
+        st.markdown(summary)
+        st.markdown("</div>", unsafe_allow_html=True)
+    
+    if questions:
+        st.markdown("<div class='analysis-card'>", unsafe_allow_html=True)
+        st.subheader("Important Questions")
+        for i, question in enumerate(questions, 1):
+            st.markdown(f"{i}. {question}")
+        st.markdown("</div>", unsafe_allow_html=True)
+    
+    if faqs:
+        st.markdown("<div class='analysis-card'>", unsafe_allow_html=True)
+        st.subheader("Frequently Asked Questions")
+        for q, a in faqs:
+            st.markdown(f"**{q}**")
+            st.markdown(a)
+            st.markdown("---")
+        st.markdown("</div>", unsafe_allow_html=True)
+
+@st.fragment(run_every=1)
+def render_progressive_preview(job):
+    """Preview cards that refresh in place until the full analysis is ready"""
+    if job.done:
+        st.rerun()
+    
+    snapshot = job.snapshot
+    if snapshot is None:
+        st.info("Sampling pages across your document...")
+        return
+    
+    st.info(f"Preview from {snapshot['pages_processed']} of {snapshot['page_count']} pages - refining in the background...")
+    st.progress(snapshot['pages_processed'] / snapshot['page_count'])
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Pages Processed", f"{snapshot['pages_processed']} / {snapshot['page_count']}")
+    with col2:
+        st.metric("Content Sections", snapshot['sections'])
+    with col3:
+        st.metric("Text Length", f"{snapshot['text_length']:,} chars")
+    
+    st.caption("Key topics so far: " + ", ".join(snapshot['topics']))
+    render_analysis_cards(snapshot['summary'], snapshot['questions'], None)
+
+def retrieve_relevant_sentences(question, chunks, max_chunks=5, max_sentences=3):
+    """Find sentences in the book content that share words with the question"""
+    relevant_sentences = []
+    question_words = set(question.lower().split())
+    # The chat searches the first 5 chunks for performance; None searches everything
+    for chunk in chunks[:max_chunks]:
+        sentences = [s.strip() for s in chunk.split('.') if len(s.strip()) > 20]
+        for sentence in sentences[:max_sentences]:
+            # Simple relevance check
+            sentence_words = set(sentence.lower().split())
+            if len(question_words.intersection(sentence_words)) > 1:
+                relevant_sentences.append(sentence)
+    return relevant_sentences
+
+# Chunk settings evaluation
+CHUNK_SWEEP = [(400, 50), (800, 100), (1200, 150), (1600, 200)]
+EVALUATION_QUERIES = 40
+
+def build_retrieval_probes(page_texts, count=EVALUATION_QUERIES):
+    """Queries built from sentences sampled across the book, paired with their source sentence"""
+    probes = []
+    for index in stratified_order(len(page_texts)):
+        sentences = [s.strip() for s in page_texts[index].split('.') if len(s.strip()) > 30]
+        if sentences:
+            sentence = sentences[len(sentences) // 2]
+            # Longest words first, ties alphabetical so probes do not depend on PYTHONHASHSEED
+            keywords = sorted(set(sentence.lower().split()), key=lambda word: (-len(word), word))[:5]
+            probes.append((" ".join(keywords), sentence))
+            if len(probes) == count:
+                break
+    return probes
+
+def same_sentence(source, retrieved):
+    """Whether a retrieved sentence holds the whole source sentence, not a chunk-cut piece of it"""
+    source = " ".join(source.lower().split())
+    retrieved = " ".join(retrieved.lower().split())
+    return source in retrieved
+
+def rank_sentences(question, sentences):
+    """Distinct sentences, most question words shared first"""
+    question_words = set(question.lower().split())
+    return sorted(
+        dict.fromkeys(sentences),
+        key=lambda sentence: len(question_words.intersection(sentence.lower().split())),
+        reverse=True
+    )
+
+def search_all_chunks(question, chunks):
+    """The four best-matching sentences of the whole book"""
+    sentences = retrieve_relevant_sentences(question, chunks, max_chunks=None, max_sentences=None)
+    return rank_sentences(question, sentences)[:4]
+
+def search_like_chat(question, chunks):
+    """The four sentences a chat answer shows"""
+    return retrieve_relevant_sentences(question, chunks)[:4]
+
+def run_probes(probes, chunks, search):
+    """Hit rate and latency percentiles of one search over the probe queries"""
+    hits = 0
+    latencies = []
+    for query, source in probes:
+        start = time.perf_counter()
+        retrieved = search(query, chunks)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if any(same_sentence(source, sentence) for sentence in retrieved):
+            hits += 1
+    latencies.sort()
+    hit_rate = f"{hits / len(probes):.0%}" if probes else "n/a"
+    p50 = round(latencies[len(latencies) // 2], 3) if latencies else 0.0
+    p95 = round(latencies[max(0, int(len(latencies) * 0.95) - 1)], 3) if latencies else 0.0
+    return hit_rate, p50, p95
+
+def evaluate_chunk_settings(page_texts, settings=CHUNK_SWEEP):
+    """Compare retrieval hit-rate and latency across chunk settings"""
+    probes = build_retrieval_probes(page_texts)
+    results = []
+    for chunk_size, chunk_overlap in settings:
+        start = time.perf_counter()
+        chunks = chunk_pages(page_texts, chunk_size, chunk_overlap)
+        chunking_ms = (time.perf_counter() - start) * 1000
+        
+        # Searching every chunk measures the chunking itself; the chat only searches the first 5
+        hit_rate, p50, p95 = run_probes(probes, chunks, search_all_chunks)
+        chat_hit_rate, chat_p50, _ = run_probes(probes, chunks, search_like_chat)
+        results.append({
+            "Chunk Size": chunk_size,
+            "Overlap": chunk_overlap,
+            "Chunks": len(chunks),
+            "Chunking ms": round(chunking_ms, 1),
+            "Hit Rate": hit_rate,
+            "p50 Retrieval ms": p50,
+            "p95 Retrieval ms": p95,
+            "Chat Hit Rate (first 5 chunks)": chat_hit_rate,
+            "Chat Text Searched": f"{sum(len(chunk) for chunk in chunks[:5]):,} chars",
+            "p50 Chat Retrieval ms": chat_p50
+        })
+    return results
+
 def answer_user_question(question, chunks, chat_history):
     """Answer user questions based on the book content"""
     try:
@@ -295,15 +1001,7 @@ def answer_user_question(question, chunks, chat_history):
             time.sleep(1)
         
         # Find relevant content
-        relevant_sentences = []
-        for chunk in chunks[:5]:  # Search first 5 chunks for performance
-            sentences = [s.strip() for s in chunk.split('.') if len(s.strip()) > 20]
-            for sentence in sentences[:3]:
-                # Simple relevance check
-                question_words = set(question.lower().split())
-                sentence_words = set(sentence.lower().split())
-                if len(question_words.intersection(sentence_words)) > 1:
-                    relevant_sentences.append(sentence)
+        relevant_sentences = retrieve_relevant_sentences(question, chunks)
         
         if not relevant_sentences:
             # Fallback to general content
@@ -449,6 +1147,13 @@ def main():
     # Inject custom CSS
     inject_custom_css()
     
+    # Initialize session state from the shared store
+    store = get_state_store()
+    load_session_state(store)
+    if 'chunk_size' not in st.session_state:
+        st.session_state.chunk_size = st.session_state.analysis_data.get('chunk_size', DEFAULT_CHUNK_SIZE)
+        st.session_state.chunk_overlap = st.session_state.analysis_data.get('chunk_overlap', DEFAULT_CHUNK_OVERLAP)
+    
     # Sidebar
     with st.sidebar:
         st.markdown("<div class='feature-card'>", unsafe_allow_html=True)
@@ -471,24 +1176,24 @@ def main():
         - Chat History
         """)
         st.markdown("</div>", unsafe_allow_html=True)
+        
+        progressive = st.checkbox(
+            "Progressive analysis",
+            value=True,
+            help="Show a preview from pages sampled across the book while the rest is processed"
+        )
+        
+        st.header("Chunk Settings")
+        chunk_size = st.number_input("Chunk size", min_value=100, max_value=4000, step=100, key="chunk_size")
+        chunk_overlap = st.number_input("Chunk overlap", min_value=0, max_value=1000, step=50, key="chunk_overlap")
+        if chunk_overlap >= chunk_size:
+            chunk_overlap = chunk_size // 2
+            st.caption(f"Overlap must be smaller than the chunk size, using {chunk_overlap}")
     
     # Main content
     st.markdown("<h1 class='main-header'>AI Book Analyzer Pro</h1>", unsafe_allow_html=True)
     st.markdown("<h3 style='text-align: center; color: #666; margin-bottom: 3rem;'>Advanced PDF Analysis with AI-Powered Insights</h3>", unsafe_allow_html=True)
     
-    # Initialize session state
-    if 'analysis_data' not in st.session_state:
-        st.session_state.analysis_data = {
-            'summary': None,
-            'questions': None,
-            'faqs': None,
-            'text_chunks': None,
-            'page_count': 0
-        }
-    
-    if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = []
-    
     # File upload section
     st.markdown("<div class='analysis-card'>", unsafe_allow_html=True)
     st.subheader("Upload Your Book")
@@ -500,17 +1205,64 @@ def main():
     )
     st.markdown("</div>", unsafe_allow_html=True)
     
-    if uploaded_file is not None:
-        # Process PDF
-        if st.session_state.analysis_data['text_chunks'] is None:
+    if uploaded_file is not None or st.session_state.analysis_data['doc_hash']:
+        preview_job = None
+        # Process PDF when nothing is loaded yet or a different file was uploaded
+        needs_processing = uploaded_file is not None and (
+            st.session_state.analysis_data['doc_hash'] is None or
+            uploaded_file.file_id != st.session_state.get('upload_id')
+        )
+        if needs_processing:
+            doc_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+            if doc_hash == st.session_state.analysis_data['doc_hash']:
+                # Same document uploaded again
+                st.session_state.upload_id = uploaded_file.file_id
+                needs_processing = False
+        if needs_processing:
+            document = store.get_document(doc_hash)
+            # The session keeps the job it is waiting on, so only it applies the preview sample
+            job = st.session_state.pop('progressive_job', None)
+            if job is not None and job.doc_hash != doc_hash:
+                job = None
+            if job is None and document is None and progressive:
+                job = start_progressive_analysis(doc_hash, uploaded_file.getvalue(), store, chunk_size, chunk_overlap)
+            if job is not None:
+                job.preview_ready.wait(PREVIEW_TIMEOUT)
+                if job.done:
+                    finish_progressive_analysis(job)
+                    if job.error:
+                        st.error(job.error)
+                        return
+                    document = store.get_document(doc_hash)
+                else:
+                    # Keep waiting across reruns; the tabs work on the pages read so far
+                    st.session_state.progressive_job = preview_job = job
+        
+        if needs_processing and preview_job is None:
             with st.spinner("Processing your document..."):
-                text, page_count = extract_text_from_pdf(uploaded_file)
-                if text:
-                    chunks = chunk_text(text)
+                if document is None:
+                    document = extract_document(uploaded_file, store)
+                    if document and document['text_length']:
+                        store.put_document(doc_hash, document)
+                    else:
+                        document = None
+                if document:
+                    chunks = document_chunks(doc_hash, document, chunk_size, chunk_overlap)
+                    page_count = document['page_count']
+                    if job is not None:
+                        # Same stratified sample the preview was built from
+                        plan_analysis(st.session_state.analysis_data, 'summary', 'stratified')
+                        plan_analysis(st.session_state.analysis_data, 'questions', 'stratified')
+                    refresh_analysis(st.session_state.analysis_data, chunks)
+                    st.session_state.upload_id = uploaded_file.file_id
+                    st.session_state.pop('chunk_evaluation', None)
                     st.session_state.analysis_data.update({
-                        'text_chunks': chunks,
-                        'page_count': page_count
+                        'doc_hash': doc_hash,
+                        'page_count': page_count,
+                        'chunk_size': chunk_size,
+                        'chunk_overlap': chunk_overlap
                     })
+                    save_session_state(store)
                     
                     # Success message with stats
                     col1, col2, col3 = st.columns(3)
@@ -519,12 +1271,36 @@ def main():
                     with col2:
                         st.metric("Content Sections", len(chunks))
                     with col3:
-                        st.metric("Text Length", f"{len(text):,} chars")
+                        st.metric("Text Length", f"{document['text_length']:,} chars")
+                    if document.get('reused_pages'):
+                        st.info(f"Reused {document['reused_pages']} unchanged pages from a previously analyzed edition")
                 else:
                     st.error("Failed to process PDF document")
                     return
         
-        chunks = st.session_state.analysis_data['text_chunks']
+        if preview_job is not None:
+            # Previews are not saved; the full results replace them once every page is read
+            snapshot = preview_job.snapshot
+            chunks = snapshot['chunks'] if snapshot else []
+        else:
+            document = store.get_document(st.session_state.analysis_data['doc_hash'])
+            if document is None:
+                st.warning("The stored document for this session is no longer available. Please upload it again.")
+                # Keep the analyses; a re-upload reuses whichever still match through refresh_analysis
+                st.session_state.analysis_data['doc_hash'] = None
+                save_session_state(store)
+                return
+            doc_hash = st.session_state.analysis_data['doc_hash']
+            settings = (
+                st.session_state.analysis_data.get('chunk_size', DEFAULT_CHUNK_SIZE),
+                st.session_state.analysis_data.get('chunk_overlap', DEFAULT_CHUNK_OVERLAP)
+            )
+            chunks = document_chunks(doc_hash, document, chunk_size, chunk_overlap)
+            if settings != (chunk_size, chunk_overlap):
+                # Re-chunked from stored page text; only analyses whose inputs changed are regenerated
+                refresh_analysis(st.session_state.analysis_data, chunks)
+                st.session_state.analysis_data.update({'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap})
+                save_session_state(store)
         
         # Create tabs for different functionalities
         tab1, tab2, tab3 = st.tabs(["Analysis Dashboard", "AI Assistant", "Export Center"])
@@ -536,47 +1312,53 @@ def main():
             # Analysis controls
             col1, col2, col3 = st.columns(3)
             with col1:
-                if st.button("Generate Smart Summary", type="primary", use_container_width=True):
+                if st.button("Generate Smart Summary", type="primary", use_container_width=True, disabled=preview_job is not None):
                     with st.spinner("Creating comprehensive summary..."):
-                        st.session_state.analysis_data['summary'] = create_detailed_summary(chunks)
+                        run_analysis(st.session_state.analysis_data, 'summary', chunks)
+                        save_session_state(store)
             
             with col2:
-                if st.button("Generate Questions", use_container_width=True):
+                if st.button("Generate Questions", use_container_width=True, disabled=preview_job is not None):
                     with st.spinner("Generating insightful questions..."):
-                        st.session_state.analysis_data['questions'] = generate_comprehensive_questions(chunks)
+                        run_analysis(st.session_state.analysis_data, 'questions', chunks)
+                        save_session_state(store)
             
             with col3:
-                if st.button("Generate FAQs", use_container_width=True):
+                if st.button("Generate FAQs", use_container_width=True, disabled=preview_job is not None):
                     with st.spinner("Creating detailed FAQs..."):
-                        st.session_state.analysis_data['faqs'] = generate_detailed_faqs(chunks)
+                        run_analysis(st.session_state.analysis_data, 'faqs', chunks)
+                        save_session_state(store)
             
             # Display results in cards
-            if st.session_state.analysis_data['summary']:
-                st.markdown("<div class='analysis-card'>", unsafe_allow_html=True)
-                st.subheader("Executive Summary")
-                st.markdown(st.session_state.analysis_data['summary'])
-                st.markdown("</div>", unsafe_allow_html=True)
-            
-            if st.session_state.analysis_data['questions']:
-                st.markdown("<div class='analysis-card'>", unsafe_allow_html=True)
-                st.subheader("Important Questions")
-                for i, question in enumerate(st.session_state.analysis_data['questions'], 1):
-                    st.markdown(f"{i}. {question}")
-                st.markdown("</div>", unsafe_allow_html=True)
-            
-            if st.session_state.analysis_data['faqs']:
-                st.markdown("<div class='analysis-card'>", unsafe_allow_html=True)
-                st.subheader("Frequently Asked Questions")
-                for q, a in st.session_state.analysis_data['faqs']:
-                    st.markdown(f"**{q}**")
-                    st.markdown(a)
-                    st.markdown("---")
-                st.markdown("</div>", unsafe_allow_html=True)
+            if preview_job is not None:
+                render_progressive_preview(preview_job)
+            else:
+                render_analysis_cards(
+                    st.session_state.analysis_data['summary'],
+                    st.session_state.analysis_data['questions'],
+                    st.session_state.analysis_data['faqs']
+                )
+                
+                with st.expander("Chunk Settings Evaluation"):
+                    st.caption("Compare retrieval hit-rate and latency across chunk settings, using queries sampled from this book")
+                    if st.button("Run Evaluation", use_container_width=True):
+                        if 'page_texts' in document:
+                            settings = list(CHUNK_SWEEP)
+                            if (chunk_size, chunk_overlap) not in settings:
+                                settings.append((chunk_size, chunk_overlap))
+                            with st.spinner("Evaluating chunk settings..."):
+                                st.session_state.chunk_evaluation = evaluate_chunk_settings(document['page_texts'], settings)
+                        else:
+                            st.warning("This document was stored without page text. Upload it again to evaluate chunk settings.")
+                    if st.session_state.get('chunk_evaluation'):
+                        st.table(st.session_state.chunk_evaluation)
         
         with tab2:
             # AI Assistant Tab
             st.subheader("Chat with AI Assistant")
             st.info("Ask any question about the book content and get AI-powered answers!")
+            if preview_job is not None:
+                st.caption("Answers use the pages read so far until the full document is processed")
             
             # Chat display
             chat_container = st.container()
@@ -618,6 +1400,7 @@ def main():
                 # Generate answer
                 answer = answer_user_question(user_question, chunks, st.session_state.chat_history)
                 st.session_state.chat_history[-1] = (user_question, answer)
+                save_session_state(store)
                 
                 st.rerun()
         
@@ -625,7 +1408,10 @@ def main():
             # Export Center
             st.subheader("Export & Download Center")
             
-            if (st.session_state.analysis_data['summary'] and 
+            if preview_job is not None:
+                st.info("Exports will be available once the full document is processed")
+            
+            elif (st.session_state.analysis_data['summary'] and 
                 st.session_state.analysis_data['questions'] and 
                 st.session_state.analysis_data['faqs']):
                 
@@ -710,11 +1496,9 @@ def main():
                 with col5:
                     # Clear data
                     if st.button("Clear Session", use_container_width=True):
-                        st.session_state.analysis_data = {
-                            'summary': None, 'questions': None, 'faqs': None, 
-                            'text_chunks': None, 'page_count': 0
-                        }
+                        st.session_state.analysis_data = empty_analysis_data()
                         st.session_state.chat_history = []
+                        save_session_state(store)
                         st.rerun()
             
             else:
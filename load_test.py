@@ -0,0 +1,281 @@
+"""Concurrent-session load test for book_analyzer.py
+
+Drives N simulated sessions headlessly with Streamlit's AppTest framework.
+Each session scripts upload -> analyze -> chat -> export against a synthetic
+PDF and the run reports rerun latency percentiles, throughput and memory.
+
+AppTest installs a process-global mock runtime for every run, so reruns from
+different sessions are serialized here. "service" is the time a rerun takes
+once it runs; "latency" also includes waiting for other sessions, i.e. a
+single-worker upper bound of what a user sees under load.
+
+A real server sleeps in script threads concurrently, so time.sleep calls made
+by the app during a run are skipped while the run holds the lock and waited
+out by that session after releasing it.
+
+    python load_test.py --sessions 20 --concurrency 5 --pages 200
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from streamlit.testing.v1 import AppTest
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book_analyzer.py")
+
+RUN_LOCK = threading.Lock()
+REAL_SLEEP = time.sleep
+# Thread running the locked rerun and the app sleep time it still owes
+RUN_STATE = {"owner": None, "deferred": 0.0}
+
+def deferred_sleep(seconds):
+    """time.sleep stand-in that moves app sleeps out of the locked section"""
+    owner = RUN_STATE["owner"]
+    if owner is not None and threading.get_ident() != owner:
+        # Only the locked rerun's script thread can be running app code
+        RUN_STATE["deferred"] += seconds
+    else:
+        REAL_SLEEP(seconds)
+
+ANALYSIS_BUTTONS = ["Generate Smart Summary", "Generate Questions", "Generate FAQs"]
+CHAT_BUTTONS = ["Main themes?", "Key findings?"]
+
+def make_synthetic_pdf(page_count, seed=0, lines_per_page=40):
+    """Build a minimal text PDF without any extra dependencies"""
+    topics = ["economic growth", "market structure", "public policy", "trade networks",
+              "labour markets", "monetary systems", "innovation cycles", "social change"]
+    pages = []
+    for p in range(page_count):
+        lines = []
+        for line in range(lines_per_page):
+            topic = topics[(seed + p + line) % len(topics)]
+            lines.append(f"Section {p + 1}.{line + 1} explains how {topic} shapes the main themes of the book.")
+        pages.append(lines)
+
+    font_id = 3 + 2 * page_count
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(page_count))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {page_count} >>".encode(),
+    ]
+    for i, lines in enumerate(pages):
+        stream = "BT /F1 9 Tf 20 820 Td 11 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    return write_pdf(objects)
+
+def write_pdf(objects):
+    """Serialize object bodies numbered from 1, with object 1 as the catalog"""
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref_offset = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        pdf += f"{offset:010d} 00000 n \n".encode()
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF".encode()
+    return pdf
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def click(at, label):
+    """Click the button with the given label"""
+    for button in at.button:
+        if button.label == label:
+            return button.click()
+    raise LookupError(f"Button not found: {label}")
+
+def document_ready(app):
+    """Whether the analysis buttons are shown and enabled"""
+    return any(button.label == ANALYSIS_BUTTONS[0] and not button.disabled for button in app.button)
+
+def run_session(session_number, pdf_bytes, timeout, think_time, ready_timeout):
+    """Script one user session and return (step, latency, service) samples"""
+    samples = []
+    app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    def timed(step, action):
+        REAL_SLEEP(think_time)
+        start = time.perf_counter()
+        with RUN_LOCK:
+            started = time.perf_counter()
+            RUN_STATE.update(owner=threading.get_ident(), deferred=0.0)
+            try:
+                action()
+            finally:
+                computed = time.perf_counter()
+                deferred = RUN_STATE["deferred"]
+                RUN_STATE["owner"] = None
+        # The user still waits for the app's sleeps, other sessions do not
+        REAL_SLEEP(deferred)
+        finished = time.perf_counter()
+        samples.append((step, finished - start, computed - started + deferred))
+        if app.exception:
+            raise RuntimeError(f"Session {session_number} failed at {step}: {app.exception[0].value}")
+
+    timed("landing", app.run)
+    timed("upload", lambda: app.file_uploader[0].set_value(
+        (f"book_{session_number}.pdf", pdf_bytes, "application/pdf")).run())
+    # Progressive analysis shows a preview first; keep rerunning until the document is ready
+    deadline = time.perf_counter() + ready_timeout
+    while not document_ready(app):
+        if app.error:
+            raise RuntimeError(f"Session {session_number} failed processing: {app.error[0].value}")
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"Session {session_number} not ready after {ready_timeout:.0f}s")
+        timed("refine", app.run)
+    for label in ANALYSIS_BUTTONS:
+        timed("analyze", lambda label=label: click(app, label).run())
+    for label in CHAT_BUTTONS:
+        timed("chat", lambda label=label: click(app, label).run())
+    # Every rerun with complete analysis renders all three export documents
+    timed("export", app.run)
+    if len(app.download_button) < 3:
+        raise RuntimeError(f"Session {session_number} did not reach the export stage")
+    return samples, app
+
+def run_load_test(sessions, concurrency, pages, unique_docs, timeout, think_time, ready_timeout):
+    """Run all sessions and collect latency, throughput and memory figures"""
+    shared_pdf = make_synthetic_pdf(pages)
+    pdfs = [make_synthetic_pdf(pages, seed=i) if unique_docs else shared_pdf for i in range(sessions)]
+
+    apps = []
+    samples = []
+    failures = []
+    lock = threading.Lock()
+
+    def worker(number):
+        try:
+            session_samples, app = run_session(number, pdfs[number], timeout, think_time, ready_timeout)
+        except Exception as e:
+            with lock:
+                failures.append(str(e))
+            return
+        with lock:
+            samples.extend(session_samples)
+            # Keep every session alive so its memory is still counted at the end
+            apps.append(app)
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    time.sleep = deferred_sleep
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, range(sessions)))
+    finally:
+        time.sleep = REAL_SLEEP
+    elapsed = time.perf_counter() - start
+    rss_after = peak_rss_mb()
+
+    by_step = {}
+    for sample in samples:
+        by_step.setdefault(sample[0], []).append(sample)
+
+    def stats(step_samples):
+        latencies = [latency for _, latency, _ in step_samples]
+        services = [service for _, _, service in step_samples]
+        return {
+            "count": len(step_samples),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "service_p50_ms": percentile(services, 50) * 1000,
+            "service_p95_ms": percentile(services, 95) * 1000,
+        }
+
+    memory_per_session = None
+    if rss_before is not None and apps:
+        memory_per_session = (rss_after - rss_before) / len(apps)
+
+    return {
+        "sessions": sessions,
+        "completed": len(apps),
+        "failures": failures,
+        "concurrency": concurrency,
+        "pages": pages,
+        "unique_docs": unique_docs,
+        "think_time_s": think_time,
+        "elapsed_s": elapsed,
+        "reruns_per_s": len(samples) / elapsed if elapsed else 0.0,
+        "sessions_per_min": len(apps) / elapsed * 60 if elapsed else 0.0,
+        "rerun_latency": stats(samples),
+        "steps": {step: stats(step_samples) for step, step_samples in by_step.items()},
+        "peak_rss_growth_mb_per_session": memory_per_session,
+    }
+
+def print_report(report):
+    """Print a plain-text summary of a load-test run"""
+    print("=" * 70)
+    print(f"Sessions: {report['completed']}/{report['sessions']} completed, "
+          f"concurrency {report['concurrency']}, {report['pages']} pages per PDF, "
+          f"{'unique' if report['unique_docs'] else 'shared'} documents, "
+          f"{report['think_time_s']:.1f}s think time")
+    print(f"Wall time: {report['elapsed_s']:.1f}s   Throughput: {report['reruns_per_s']:.2f} reruns/s, "
+          f"{report['sessions_per_min']:.1f} sessions/min")
+    memory = report["peak_rss_growth_mb_per_session"]
+    print(f"Memory: {'n/a' if memory is None else f'{memory:.1f} MB'} peak RSS growth per session")
+    print("Latency includes queueing behind other sessions' reruns, which AppTest serializes,")
+    print("so it is an upper bound; svc is the rerun itself, including app sleeps")
+    print("-" * 70)
+    print(f"{'step':<12}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'svc p50':>10}{'svc p95':>10}")
+    rows = list(report["steps"].items()) + [("all reruns", report["rerun_latency"])]
+    for step, s in rows:
+        print(f"{step:<12}{s['count']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+              f"{s['service_p50_ms']:>10.1f}{s['service_p95_ms']:>10.1f}")
+    for failure in report["failures"]:
+        print(f"FAILED: {failure}")
+    print("=" * 70)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the book analyzer with simulated sessions")
+    parser.add_argument("--sessions", type=int, default=10, help="number of simulated sessions")
+    parser.add_argument("--concurrency", type=int, default=5, help="sessions running at the same time")
+    parser.add_argument("--pages", type=int, default=50, help="pages per synthetic PDF")
+    parser.add_argument("--unique-docs", action="store_true", help="give every session a different PDF")
+    parser.add_argument("--think-time", type=float, default=0.5, help="pause before each user action in seconds")
+    parser.add_argument("--timeout", type=float, default=120, help="per-rerun timeout in seconds")
+    parser.add_argument("--ready-timeout", type=float, default=300,
+                        help="seconds to wait for a document to finish processing")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    report = run_load_test(args.sessions, args.concurrency, args.pages, args.unique_docs, args.timeout,
+                           args.think_time, args.ready_timeout)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["failures"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
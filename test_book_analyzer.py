@@ -0,0 +1,321 @@
+import io
+import os
+import random
+import subprocess
+import sys
+import textwrap
+import zlib
+
+import book_analyzer
+from load_test import write_pdf
+
+
+def make_form_xobject_pdf(page_lines):
+    """PDF whose pages all have the content stream 'q /Fm1 Do Q' and draw text via their own XObject"""
+    count = len(page_lines)
+    font_id = 3 + 3 * count
+    kids = " ".join(f"{3 + 3 * i} 0 R" for i in range(count))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {count} >>".encode(),
+    ]
+    for i, line in enumerate(page_lines):
+        content = "q /Fm1 Do Q"
+        form = f"BT /F1 12 Tf 20 800 Td ({line}) Tj ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {4 + 3 * i} 0 R "
+            f"/Resources << /XObject << /Fm1 {5 + 3 * i} 0 R >> >> >>".encode()
+        )
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream".encode())
+        objects.append(
+            f"<< /Type /XObject /Subtype /Form /BBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Length {len(form)} >>\n"
+            f"stream\n{form}\nendstream".encode()
+        )
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    return write_pdf(objects)
+
+
+def test_form_xobject_pages_are_not_reused_across_books():
+    store = book_analyzer.InMemoryStateStore()
+    book_a = make_form_xobject_pdf([f"Book A page {i} talks about apples and orchards" for i in range(5)])
+    book_b = make_form_xobject_pdf([f"Book B page {i} talks about rockets and orbits" for i in range(5)])
+
+    document_a = book_analyzer.extract_document(io.BytesIO(book_a), store)
+    store.put_document("a", document_a)
+    document_b = book_analyzer.extract_document(io.BytesIO(book_b), store)
+
+    assert len(set(document_a['page_fingerprints'])) == 5
+    assert document_b['reused_pages'] == 0
+    assert all(text.startswith("Book B") for text in document_b['page_texts'])
+
+
+def make_compressed_pdf(page_lines):
+    """PDF whose page content streams are Flate-compressed"""
+    count = len(page_lines)
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(count))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {count} >>".encode(),
+    ]
+    for i, line in enumerate(page_lines):
+        stream = zlib.compress(f"BT /F1 12 Tf 20 800 Td ({line}) Tj ET".encode())
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {3 + 2 * count} 0 R >> >> >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode()
+                       + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    return write_pdf(objects)
+
+
+def test_fingerprints_hash_encoded_streams_without_decoding(monkeypatch):
+    reader = book_analyzer.PyPDF2.PdfReader(io.BytesIO(make_compressed_pdf(["First page", "Second page", "First page"])))
+
+    def no_decoding(self):
+        raise AssertionError("stream was decoded")
+    monkeypatch.setattr(book_analyzer.PyPDF2.generic.EncodedStreamObject, "get_data", no_decoding)
+    fingerprints = book_analyzer.page_fingerprints(reader)
+
+    assert fingerprints[0] == fingerprints[2]
+    assert fingerprints[0] != fingerprints[1]
+
+
+def test_new_edition_reuses_only_unchanged_pages():
+    store = book_analyzer.InMemoryStateStore()
+    lines = [f"Book A page {i} talks about apples and orchards" for i in range(5)]
+    store.put_document("a", book_analyzer.extract_document(io.BytesIO(make_form_xobject_pdf(lines)), store))
+
+    lines[3] = "A revised page about pears"
+    edition = book_analyzer.extract_document(io.BytesIO(make_form_xobject_pdf(lines)), store)
+
+    assert edition['reused_pages'] == 4
+    assert edition['page_texts'][3].startswith("A revised page")
+
+
+def test_ambiguous_and_blank_fingerprints_are_not_reusable():
+    document = {
+        'page_fingerprints': ["same", "same", "blank", "ok"],
+        'page_texts': ["first text", "second text", "  \n", "only text"],
+    }
+    assert book_analyzer.unique_page_texts(document) == {"ok": "only text"}
+
+
+def test_reused_edition_chunks_match_a_first_upload():
+    store = book_analyzer.InMemoryStateStore()
+    lines = [f"Book A page {i} talks about apples and orchards" for i in range(5)]
+    store.put_document("a", book_analyzer.extract_document(io.BytesIO(make_form_xobject_pdf(lines)), store))
+
+    lines[3] = "A revised page about pears"
+    pdf = make_form_xobject_pdf(lines)
+    edition = book_analyzer.extract_document(io.BytesIO(pdf), store)
+    first_upload = book_analyzer.extract_document(io.BytesIO(pdf), book_analyzer.InMemoryStateStore())
+
+    assert edition['reused_pages'] == 4
+    assert edition['chunks'] == first_upload['chunks']
+
+
+def test_refresh_regenerates_only_analyses_whose_sources_changed(monkeypatch):
+    calls = []
+    monkeypatch.setitem(book_analyzer.ANALYSIS_INPUTS, 'summary', (lambda chunks: calls.append('summary') or "s", 8))
+    monkeypatch.setitem(book_analyzer.ANALYSIS_INPUTS, 'faqs', (lambda chunks: calls.append('faqs') or ["f"], 4))
+    chunks = [f"chunk {i}" for i in range(20)]
+    analysis_data = book_analyzer.empty_analysis_data()
+    book_analyzer.run_analysis(analysis_data, 'summary', chunks, 'stratified')
+    book_analyzer.run_analysis(analysis_data, 'faqs', chunks)
+    calls.clear()
+
+    # A change past the FAQ window but inside the stratified sample
+    sampled = book_analyzer.stratified_chunks_first(chunks)[:8]
+    changed = [chunk + " revised" if chunk == sampled[-1] else chunk for chunk in chunks]
+    assert changed[:4] == chunks[:4]
+    book_analyzer.refresh_analysis(analysis_data, changed)
+    assert calls == ['summary']
+
+    calls.clear()
+    book_analyzer.refresh_analysis(analysis_data, changed)
+    assert calls == []
+
+
+def make_varied_pages(page_count, sentences_per_page=12):
+    """Pages of distinct sentences wrapped into short lines, like extracted PDF text"""
+    rng = random.Random(7)
+    vocabulary = [f"{stem}{suffix}" for stem in ("harbor", "lantern", "quarry", "meadow", "glacier", "orchard",
+                                                 "citadel", "furnace", "archive", "canyon", "monsoon", "vineyard")
+                  for suffix in ("", "s", "ing", "ed", "ward", "ful")]
+    pages = []
+    for _ in range(page_count):
+        sentences = [" ".join(rng.sample(vocabulary, 14)).capitalize() + "." for _ in range(sentences_per_page)]
+        pages.append("\n".join(textwrap.wrap(" ".join(sentences), 80)))
+    return pages
+
+
+def test_chunk_settings_evaluation_distinguishes_settings():
+    results = book_analyzer.evaluate_chunk_settings(make_varied_pages(30), [(300, 0), (1600, 200)])
+    small, large = results
+
+    # Small chunks without overlap cut more sentences apart
+    assert int(small["Hit Rate"].rstrip("%")) < int(large["Hit Rate"].rstrip("%"))
+    # The chat's search covers far less text with small chunks
+    assert small["Chat Text Searched"] != large["Chat Text Searched"]
+    assert small["Chunks"] > large["Chunks"]
+    assert all(result["p50 Retrieval ms"] > 0 for result in results)
+
+
+def test_touch_keeps_a_session_alive_and_reports_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(book_analyzer.time, "time", lambda: now[0])
+    store = book_analyzer.InMemoryStateStore(session_ttl=10)
+    store.save("reader", "analysis_data", {'doc_hash': "a"})
+
+    for _ in range(3):
+        now[0] += 8
+        assert store.touch("reader")
+    store.save("other", "analysis_data", {})
+    assert store.load("reader", "analysis_data") == {'doc_hash': "a"}
+
+    now[0] += 11
+    store.save("other", "analysis_data", {})
+    assert not store.touch("reader")
+
+
+def test_retrieval_probes_do_not_depend_on_hash_seed():
+    script = (
+        "import json, test_book_analyzer as t, book_analyzer as b; "
+        "print(json.dumps(b.build_retrieval_probes(t.make_varied_pages(30))))"
+    )
+    outputs = set()
+    for seed in ("0", "1", "7"):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        result = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        outputs.add(result.stdout)
+    assert len(outputs) == 1
+
+
+def test_sqlite_store_round_trips_session_values(tmp_path):
+    store = book_analyzer.SQLiteStateStore(str(tmp_path / "state.db"))
+    store.save("s1", "chat_history", [("Main themes?", "Growth")])
+    store.save("s1", "analysis_data", {'doc_hash': "a", 'faqs': [("Q", "A")]})
+
+    # A fresh store reads the file back; tuples come back as lists through JSON
+    reopened = book_analyzer.SQLiteStateStore(str(tmp_path / "state.db"))
+    assert reopened.load("s1", "chat_history") == [["Main themes?", "Growth"]]
+    assert reopened.load("s1", "analysis_data") == {'doc_hash': "a", 'faqs': [["Q", "A"]]}
+    assert reopened.load("s1", "missing", []) == []
+    assert reopened.load("s2", "chat_history") is None
+
+
+def test_sqlite_store_does_not_cache_document_misses(tmp_path):
+    store = book_analyzer.SQLiteStateStore(str(tmp_path / "state.db"))
+    assert store.get_document("a") is None
+
+    store.put_document("a", {'chunks': ["text"]})
+    assert store.get_document("a") == {'chunks': ["text"]}
+
+    # Another replica writing the same file is seen after a miss here
+    other = book_analyzer.SQLiteStateStore(str(tmp_path / "state.db"))
+    assert other.get_document("b") is None
+    store.put_document("b", {'chunks': ["more"]})
+    assert other.get_document("b") == {'chunks': ["more"]}
+
+
+def test_in_memory_store_evicts_idle_and_excess_sessions(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(book_analyzer.time, "time", lambda: now[0])
+    store = book_analyzer.InMemoryStateStore(session_ttl=60, max_sessions=2)
+    store.save("idle", "analysis_data", {})
+    now[0] += 61
+    store.save("fresh", "analysis_data", {})
+    assert store.load("idle", "analysis_data") is None
+    assert store.load("fresh", "analysis_data") == {}
+
+    store.save("second", "analysis_data", {})
+    store.save("third", "analysis_data", {})
+    assert store.load("fresh", "analysis_data") is None
+    assert store.load("second", "analysis_data") == {}
+    assert store.load("third", "analysis_data") == {}
+
+
+def test_evicted_documents_leave_the_page_index():
+    store = book_analyzer.InMemoryStateStore(max_unreferenced_documents=1)
+
+    def document(name):
+        return {'chunks': [], 'page_fingerprints': [f"{name}-1", f"{name}-2", "shared"],
+                'page_texts': [f"{name} one", f"{name} two", "shared text"]}
+
+    store.save("reader", "analysis_data", {'doc_hash': "kept"})
+    store.put_document("kept", document("kept"))
+    store.put_document("old", document("old"))
+    store.put_document("new", document("new"))
+
+    assert store.get_document("old") is None
+    assert store.get_document("kept") is not None and store.get_document("new") is not None
+    assert "old-1" not in store._pages and "old-2" not in store._pages
+    assert store._pages["shared"] == {"kept", "new"}
+    assert store.find_document_by_pages(["old-1", "old-2"]) is None
+
+
+def test_stratified_order_spreads_every_prefix():
+    assert book_analyzer.stratified_order(0) == []
+    assert book_analyzer.stratified_order(1) == [0]
+    for count in (2, 7, 100, 1000):
+        order = book_analyzer.stratified_order(count)
+        assert sorted(order) == list(range(count))
+        for size in (2, 4, 8, 16):
+            prefix = sorted(order[:size])
+            if count >= size:
+                # No gap in a prefix is much wider than an even split of the range
+                gaps = [b - a for a, b in zip(prefix, prefix[1:])] + [count - prefix[-1]]
+                assert prefix[0] == 0 and max(gaps) <= 2 * count / size + 1
+
+
+def test_stratified_chunks_first_moves_a_spread_sample_to_the_front():
+    chunks = [f"chunk {i}" for i in range(20)]
+    ordered = book_analyzer.stratified_chunks_first(chunks, sample_size=4)
+
+    assert ordered[:4] == ["chunk 0", "chunk 5", "chunk 10", "chunk 15"]
+    assert sorted(ordered) == sorted(chunks)
+    assert ordered[4:] == [chunk for chunk in chunks if chunk not in ordered[:4]]
+    assert book_analyzer.stratified_chunks_first([]) == []
+
+
+def test_planned_stratified_analyses_run_once(monkeypatch):
+    calls = []
+    monkeypatch.setitem(book_analyzer.ANALYSIS_INPUTS, 'summary', (lambda chunks: calls.append(chunks[:2]) or "s", 8))
+    chunks = [f"chunk {i}" for i in range(20)]
+    analysis_data = book_analyzer.empty_analysis_data()
+
+    book_analyzer.plan_analysis(analysis_data, 'summary', 'stratified')
+    book_analyzer.refresh_analysis(analysis_data, chunks)
+    assert calls == [book_analyzer.stratified_chunks_first(chunks)[:2]]
+
+    # The next preview of the same document keeps the stratified summary
+    book_analyzer.plan_analysis(analysis_data, 'summary', 'stratified')
+    book_analyzer.refresh_analysis(analysis_data, chunks)
+    assert len(calls) == 1
+
+
+def test_start_progressive_analysis_prunes_finished_jobs(monkeypatch):
+    class FakeJob:
+        def __init__(self, doc_hash, pdf_bytes, store, chunk_size, chunk_overlap):
+            self.doc_hash = doc_hash
+            self.done = False
+
+    monkeypatch.setattr(book_analyzer, "ProgressiveAnalysis", FakeJob)
+    _, jobs = book_analyzer.get_progressive_jobs()
+    jobs.clear()
+
+    finished = book_analyzer.start_progressive_analysis("a", b"", None)
+    running = book_analyzer.start_progressive_analysis("b", b"", None)
+    assert book_analyzer.start_progressive_analysis("b", b"", None) is running
+    finished.done = True
+
+    book_analyzer.start_progressive_analysis("c", b"", None)
+    assert set(jobs) == {"b", "c"}
+
+    running.done = True
+    book_analyzer.finish_progressive_analysis(running)
+    assert set(jobs) == {"c"}
+    jobs.clear()